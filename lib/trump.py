@@ -3,14 +3,29 @@
 トランプライブラリ
 """
 
-from typing import List, Tuple, Dict, Literal, Optional, Union, Callable, ClassVar, Type, cast, Final, final
+from typing import Any, List, Tuple, Dict, Iterable, Iterator, Sequence, NamedTuple, Literal, Optional, Union, Callable, ClassVar, Type, cast, Final, final
 import random
 import os
-import asyncio
-from itertools import combinations
+import math
+import mmap
+import atexit
+import struct
+from array import array
+import queue
+import threading
+from bisect import bisect_left
+from itertools import combinations, combinations_with_replacement, chain
+from collections import OrderedDict
+from operator import attrgetter, itemgetter
 from concurrent import futures
+from multiprocessing import shared_memory
 import time
 
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
 
 # type alias
 ta_suit_char = Literal["s", "h", "d", "c"]
@@ -30,13 +45,24 @@ ta_judgement = Tuple[
     Literal[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18],
     List["Card"]
 ]
+ta_engine = Literal["table", "histogram", "reference"]
+ta_storage = Literal["list", "array"]
+ta_low_mode = Literal["2-7", "A-5"]
+ta_mode = Literal["high", "2-7", "A-5"]
 
 
 class Card:
     """
     カードデータ
+
+    同じカードは常に同じインスタンスを返す(変更不可)
     """
 
+    __slots__ = (
+        "__suit", "__rank", "__isJoker", "__code",
+        "__judgeStr", "__suitPower", "__rankOrder", "__sortKey"
+    )
+
     # スート(判定用)
     _SUIT_CHAR_TYPE: Final[Tuple[
         Literal["s"], Literal["h"], Literal["d"], Literal["c"]
@@ -66,11 +92,78 @@ class Card:
         "8", "9", "10", "J", "Q", "K"
     )
 
-    def __init__(self, suit: ta_suit_char = "s", rank: ta_rank_char = 1, *, isJoker: bool = False) -> None:
-        self.__suit: Final[ta_suit_char] = suit
-        self.__rank: Final[ta_rank_char] = rank
+    # カード番号
+    # (スート順 * 13 + ランク - 1, ジョーカーは52から)
+    CODE_JOKER: Final[int] = 52
+    CODE_MAX: Final[int] = 54
+
+    # カード番号ごとの並べ替え用の値
+    # (ランクの強さ * 8 + スート順、ジョーカーは最後)
+    CODE_SORT_KEY: Final[Tuple[int, ...]] = tuple(
+        (14 if c % 13 == 0 else c % 13 + 1) * 8 + c // 13 if c < 52 else 15 * 8 + c - 52
+        for c in range(54)
+    )
+
+    # 並べ替え用のkey関数
+    sortKeyOf: Final[Callable[["Card"], int]] = attrgetter("_Card__sortKey")
+
+    # カード番号を取り出すkey関数
+    codeOf: Final[Callable[["Card"], int]] = attrgetter("_Card__code")
+
+    # 生成済みのカード
+    __interned: ClassVar[Dict[Tuple[type, int], "Card"]] = {}
+
+    def __new__(cls, suit: ta_suit_char = "s", rank: ta_rank_char = 1, *, isJoker: bool = False, jokerNo: int = 0) -> "Card":
+        if isJoker:
+            if not isinstance(jokerNo, int) or not 0 <= jokerNo < cls.CODE_MAX - cls.CODE_JOKER:
+                raise ValueError(f"Invalid jokerNo: {jokerNo}")
+            code = cls.CODE_JOKER + jokerNo
+        else:
+            if suit not in cls._SUIT_CHAR_TYPE:
+                raise ValueError(f"Invalid suit: {suit}")
+            if not isinstance(rank, int) or not 1 <= rank <= 13:
+                raise ValueError(f"Invalid rank: {rank}")
+            code = cls._SUIT_CHAR_TYPE.index(suit) * 13 + rank - 1
+
+        key = (cls, code)
+        self = Card.__interned.get(key)
+        if self is not None:
+            return self
+
+        self = super().__new__(cls)
+        object.__setattr__(self, "_Card__suit", suit)
+        object.__setattr__(self, "_Card__rank", rank)
+        object.__setattr__(self, "_Card__isJoker", isJoker)
+        object.__setattr__(self, "_Card__code", code)
+
+        # 判定で使う値は先に計算しておく
+        if isJoker:
+            object.__setattr__(self, "_Card__judgeStr", "Joker")
+            object.__setattr__(self, "_Card__suitPower", cls._SUIT_POWER["Joker"])
+            object.__setattr__(self, "_Card__rankOrder", 15)
+        else:
+            object.__setattr__(self, "_Card__judgeStr", f"{suit}{rank}")
+            object.__setattr__(self, "_Card__suitPower", cls._SUIT_POWER[suit])
+            object.__setattr__(self, "_Card__rankOrder", 14 if rank == 1 else rank)
+        object.__setattr__(self, "_Card__sortKey", cls.CODE_SORT_KEY[code])
+
+        Card.__interned[key] = self
+        return self
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError("Card is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("Card is immutable")
+
+    def __copy__(self) -> "Card":
+        return self
 
-        self.__isJoker: Final[bool] = isJoker
+    def __deepcopy__(self, memo: dict) -> "Card":
+        return self
+
+    def __reduce__(self) -> Tuple[Callable[[int], "Card"], Tuple[int]]:
+        return self.__class__.fromCode, (self.__code,)
 
     def __str__(self) -> str:
         if self.__isJoker:
@@ -81,6 +174,8 @@ class Card:
         return True
 
     def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
         if not isinstance(other, Card):
             return False
         if self.__isJoker or other.__isJoker:
@@ -90,54 +185,26 @@ class Card:
     def __gt__(self, other: object) -> bool:
         if not isinstance(other, Card):
             return False
-        if self.rank == other.rank:
-            return self.rank == "Joker"
-        jg = self._joker_gt(other)
-        if jg is not None:
-            return jg
-        rg = self._rank_gt(other)
-        if rg is None:
-            return False
-        return rg
+        if self.__rankOrder == other.__rankOrder:
+            return self.__isJoker
+        return self.__rankOrder > other.__rankOrder
 
     def __lt__(self, other: object) -> bool:
         if not isinstance(other, Card):
             return False
-        if self.rank == other.rank:
-            return self.rank == "Joker"
-        jg = other._joker_gt(self)
-        if jg is not None:
-            return jg
-        rg = other._rank_gt(self)
-        if rg is None:
-            return False
-        return rg
+        if self.__rankOrder == other.__rankOrder:
+            return self.__isJoker
+        return self.__rankOrder < other.__rankOrder
 
     def __ge__(self, other: object) -> bool:
         if not isinstance(other, Card):
             return False
-        if self.rank == other.rank:
-            return True
-        jg = self._joker_gt(other)
-        if jg is not None:
-            return jg
-        rg = self._rank_gt(other)
-        if rg is None:
-            return False
-        return rg
+        return self.__rankOrder >= other.__rankOrder
 
     def __le__(self, other: object) -> bool:
         if not isinstance(other, Card):
             return False
-        if self.rank == other.rank:
-            return True
-        jg = other._joker_gt(self)
-        if jg is not None:
-            return jg
-        rg = other._rank_gt(self)
-        if rg is None:
-            return False
-        return rg
+        return self.__rankOrder <= other.__rankOrder
 
     def _joker_gt(self, other: "Card") -> Optional[bool]:
         if self.rank == "Joker":
@@ -165,10 +232,29 @@ class Card:
         return self.suit == other.suit
 
     def suit_gt(self, other: "Card") -> Optional[bool]:
-        return self._SUIT_POWER[self.suit] > self._SUIT_POWER[other.suit]
+        return self.__suitPower > other.__suitPower
 
     def suit_lt(self, other: "Card") -> Optional[bool]:
-        return self._SUIT_POWER[self.suit] < self._SUIT_POWER[other.suit]
+        return self.__suitPower < other.__suitPower
+
+    @classmethod
+    def fromCode(cls, code: int) -> "Card":
+        """
+        カード番号から変換
+        """
+        c = Card.__interned.get((cls, code))
+        if c is not None:
+            return c
+        if code >= cls.CODE_JOKER:
+            if code >= cls.CODE_MAX:
+                raise ValueError(f"Invalid code: {code}")
+            return cls(isJoker=True, jokerNo=code-cls.CODE_JOKER)
+        if code < 0:
+            raise ValueError(f"Invalid code: {code}")
+        return cls(
+            suit=cls._SUIT_CHAR_TYPE[code // 13],
+            rank=cast(ta_rank_char, code % 13 + 1)
+        )
 
     @classmethod
     def convert(cls, s: str) -> "Card":
@@ -191,7 +277,7 @@ class Card:
         """
         スートの数値
         """
-        return self._SUIT_POWER[self.__suit]
+        return self.__suitPower
 
     @final
     @property
@@ -239,68 +325,170 @@ class Card:
         """
         判定用文字出力
         """
-        if self.__isJoker:
-            return "Joker"
-        return f"{self.suit}{self.rank}"
+        return self.__judgeStr
+
+    @final
+    @property
+    def sortKey(self) -> int:
+        """
+        並べ替え用の値
+        (ランクの強さ順、同じランクはスートの強い順)
+        """
+        return self.__sortKey
+
+    @final
+    @property
+    def rankOrder(self) -> int:
+        """
+        ランクの強さ
+        (2～13, A: 14, ジョーカー: 15)
+        """
+        return self.__rankOrder
+
+    @final
+    @property
+    def code(self) -> int:
+        """
+        カード番号
+        * 0～51: 通常カード
+        * 52～: ジョーカー
+        """
+        return self.__code
 
 
 class CardDeck:
     """
     カードデッキ
+
+    storage="array"の場合はカード番号をarray('B')で保持し、
+    Cardは取得時に生成する
     """
 
-    def __init__(self, trump: "Trump", cardList: List[Card]) -> None:
+    __slots__ = ("__base", "__storage", "__cardList", "__codes", "__state", "_isThrowDeck")
+
+    # 使わない側の保持先(共有・変更しない)
+    _NO_CARDS: ClassVar[List[Card]] = []
+    _NO_CODES: ClassVar[array] = array("B")
+
+    def __init__(self, trump: "Trump", cardList: List[Card], *, storage: ta_storage = "list") -> None:
         self.__base: Trump = trump
-        self.__cardList: List[Card] = cardList
+        self.__storage: Final[ta_storage] = storage
+        self.__cardList: List[Card] = self._NO_CARDS
+        self.__codes: array = self._NO_CODES
+        self.__state: Optional[HandState] = None
+
+        self.reset(cardList)
 
-        self._isThrowDeck = len(self.__cardList) == 0
+        self._isThrowDeck = len(cardList) == 0
 
     def __str__(self) -> str:
         s = ""
-        for card in self.__cardList:
+        for card in self.cardList:
             s += str(card) + ", "
         return f"[{s[:-2]}]"
 
     def __len__(self) -> int:
+        if self.__storage == "array":
+            return len(self.__codes)
         return len(self.__cardList)
 
+    @classmethod
+    def fromCodes(cls, trump: "Trump", codes: Iterable[int], *, storage: ta_storage = "array") -> "CardDeck":
+        """
+        カード番号から作成
+        """
+        deck = cls(trump, [], storage=storage)
+        for code in codes:
+            deck.addCode(code)
+        deck._isThrowDeck = len(deck) == 0
+        return deck
+
     def copy(self) -> "CardDeck":
         """
         複製
         """
+        if self.__storage == "array":
+            return CardDeck.fromCodes(self.__base, self.__codes)
         return CardDeck(self.__base, self.__cardList.copy())
 
     def reset(self, cardList: List[Card]) -> None:
         """
         リセット
         """
-        self.__cardList = cardList
+        if self.__storage == "array":
+            self.__codes = array("B", [c.code for c in cardList])
+        else:
+            self.__cardList = cardList
+        if self.__state is not None:
+            self.__state.reset(self.codes)
+
+    def attachState(self) -> "HandState":
+        """
+        差分更新する判定状態を付ける
+
+        以後add, addCode, pop, remove, resetで自動更新される
+        (cardListを直接変更した場合は更新されない、copyには引き継がない)
+        """
+        if self.__state is None:
+            self.__state = HandState(self.codes)
+        return self.__state
+
+    def detachState(self) -> None:
+        """
+        判定状態を外す
+        """
+        self.__state = None
 
     def sort(self) -> None:
         """
         ソート
         (並びはポーカーでの強さ順)
         """
-        self.__cardList.sort(key=lambda x: x.suit_power, reverse=True)
-        self.__cardList.sort()
+        if self.__storage == "array":
+            self.__codes = array("B", sorted(self.__codes, key=Card.CODE_SORT_KEY.__getitem__))
+            return
+        self.__cardList.sort(key=Card.sortKeyOf)
 
     def add(self, card: Card) -> None:
         """
         カード追加
         """
-        self.__cardList.append(card)
+        if self.__storage == "array":
+            self.__codes.append(card.code)
+        else:
+            self.__cardList.append(card)
+        if self.__state is not None:
+            self.__state.add(card.code)
+
+    def addCode(self, code: int) -> None:
+        """
+        カード追加(カード番号)
+        """
+        if self.__storage == "array":
+            self.__codes.append(code)
+        else:
+            self.__cardList.append(Card.fromCode(code))
+        if self.__state is not None:
+            self.__state.add(code)
 
     def get(self, index: int = 0) -> Card:
         """
         カード取得
         """
+        if self.__storage == "array":
+            return Card.fromCode(self.__codes[index])
         return self.__cardList[index]
 
     def pop(self, index: int = 0, moveThrowDeck: bool = True) -> Card:
         """
         カード取得(削除)
         """
-        c = self.__cardList.pop(index)
+        if self.__storage == "array":
+            c = Card.fromCode(self.__codes.pop(index))
+        else:
+            c = self.__cardList.pop(index)
+        if self.__state is not None:
+            self.__state.remove(c.code)
         if moveThrowDeck and not self._isThrowDeck:
             self.__base.throwDeck.add(c)
         return c
@@ -310,11 +498,16 @@ class CardDeck:
         カード削除
         (先頭一致)
         """
-        for i, c in enumerate(self.__cardList):
+        for i, c in enumerate(self.cardList):
             if c.judgeStr == name:
                 if moveThrowDeck and not self._isThrowDeck:
                     self.__base.throwDeck.add(c)
-                self.__cardList.pop(i)
+                if self.__storage == "array":
+                    self.__codes.pop(i)
+                else:
+                    self.__cardList.pop(i)
+                if self.__state is not None:
+                    self.__state.remove(c.code)
                 return
         raise ValueError(f"{name}は見つかりません")
 
@@ -323,30 +516,89 @@ class CardDeck:
         カードのインデックス取得
         """
         if isinstance(card, str):
-            for i, c in enumerate(self.__cardList):
+            for i, c in enumerate(self.cardList):
                 if c.judgeStr == card:
                     return i
             return -1
         elif isinstance(card, Card):
-            return self.__cardList.index(card)
+            cl = self.cardList
+            for i, c in enumerate(cl):
+                if c is card:
+                    return i
+            return cl.index(card)
         raise ValueError(f"{card}は見つかりません")
 
     @property
     def cardList(self) -> List[Card]:
         """
         カードリスト
+
+        (storage="array"の場合は毎回生成した複製)
         """
+        if self.__storage == "array":
+            return [Card.fromCode(code) for code in self.__codes]
         return self.__cardList
 
+    @property
+    def codes(self) -> array:
+        """
+        カード番号の配列
+
+        (storage="array"の場合は内部配列そのもの)
+        """
+        if self.__storage == "array":
+            return self.__codes
+        return array("B", [c.code for c in self.__cardList])
+
+    @property
+    def mask(self) -> int:
+        """
+        カード番号のビットマスク
+        (並び順に依存しない手札のキー)
+        """
+        m = 0
+        if self.__storage == "array":
+            for code in self.__codes:
+                m |= 1 << code
+        else:
+            for c in self.__cardList:
+                m |= 1 << c.code
+        return m
+
+    @property
+    def state(self) -> Optional["HandState"]:
+        """
+        差分更新する判定状態
+        (attachStateしていない場合はNone)
+        """
+        return self.__state
+
+    @property
+    def storage(self) -> ta_storage:
+        """
+        保持形式
+        """
+        return self.__storage
+
 
 class Trump:
     """
     トランプデータの管理
     """
 
+    __slots__ = (
+        "__useJokerCou", "__useSuitType", "__useRankType",
+        "__cardList", "__deckList", "__throwDeck"
+    )
+
     Card_: ClassVar[Type[Card]] = Card
     CardDeck_: ClassVar[Type[CardDeck]] = CardDeck
 
+    _TEMPLATE: ClassVar[Dict[
+        Tuple[int, Tuple[ta_suit_char, ...], Tuple[ta_rank_char, ...]],
+        Tuple[Card, ...]
+    ]] = {}
+
     def __init__(
         self,
         useJokerCou: Literal[0, 1, 2] = 1,
@@ -381,12 +633,30 @@ class Trump:
         リセット
         """
         self.__cardList.clear()
-        for suit in self.__useSuitType:
-            for rank in self.__useRankType:
-                self.__cardList.append(Card(suit, rank))
+        self.__cardList.extend(self._template(
+            self.__useJokerCou,
+            tuple(self.__useSuitType),
+            tuple(self.__useRankType)
+        ))
 
-        for _ in range(self.__useJokerCou):
-            self.__cardList.append(Card(isJoker=True))
+    @classmethod
+    def _template(cls, useJokerCou: int, useSuitType: Tuple[ta_suit_char, ...], useRankType: Tuple[ta_rank_char, ...]) -> Tuple[Card, ...]:
+        """
+        デッキ構成ごとのカード一覧
+        (構成ごとに一度だけ作成)
+        """
+        key = (useJokerCou, useSuitType, useRankType)
+        t = cls._TEMPLATE.get(key)
+        if t is None:
+            lst: List[Card] = []
+            for suit in useSuitType:
+                for rank in useRankType:
+                    lst.append(cls.Card_(suit, rank))
+            for i in range(useJokerCou):
+                lst.append(cls.Card_(isJoker=True, jokerNo=i))
+            t = tuple(lst)
+            cls._TEMPLATE[key] = t
+        return t
 
     def shuffle(self) -> None:
         """
@@ -462,11 +732,443 @@ class Trump:
         return self.__throwDeck
 
 
+class HandStrength(int):
+    """
+    役の強さ
+
+    役とキッカー全てを1つの整数にまとめたもの
+    (大きいほど強い、int32に収まる)
+    * 24～: 役
+    * 20～4: キッカーのランクの強さ(4bitずつ、最大5枚)
+    * 0～3: スートの強さ(ロイヤルストレートフラッシュのみ)
+    """
+
+    __slots__ = ()
+
+    _STRAIGHT_JUDGE: Final[Tuple[int, ...]] = (6, 7, 14, 15, 16, 17)
+    # ジョーカーを含むフラッシュ(キッカーにジョーカーの分が無い)
+    _JOKER_FLUSH_JUDGE: Final[int] = 8
+
+    @classmethod
+    def fromJudgement(cls, judge: ta_judgement) -> "HandStrength":
+        """
+        役判定の結果から変換
+        """
+        j, h = judge
+        return cls.fromRanks(
+            j,
+            [c.rankOrder for c in h],
+            h[0].suit_power if j == 17 else 0
+        )
+
+    @classmethod
+    def fromRanks(cls, judge: int, ranks: List[int], suitPower: int = 0) -> "HandStrength":
+        """
+        役とキッカーのランクの強さから変換
+
+        (ジョーカーを含むフラッシュはジョーカーの分を補う)
+        """
+        v = judge << 24
+        if judge in cls._STRAIGHT_JUDGE:
+            # ストレートは一番上のランクのみで比較
+            v |= cls._straightTop(ranks) << 20
+            if judge == 17:
+                v |= suitPower
+            return cls(v)
+        if judge == cls._JOKER_FLUSH_JUDGE and len(ranks) < 5:
+            # ジョーカーは手札に無い一番強いランクとしてキッカーに入れる
+            ranks = sorted(
+                list(ranks) + [o for o in range(14, 1, -1) if o not in ranks][:5 - len(ranks)],
+                reverse=True
+            )
+        for i, o in enumerate(ranks[:5]):
+            v |= o << (20 - i * 4)
+        return cls(v)
+
+    @staticmethod
+    def _straightTop(ranks: List[int]) -> int:
+        """
+        ストレートの一番上のランク
+        (ranksは降順、ジョーカー分は含まない)
+        """
+        if ranks[0] == 14 and len(ranks) > 1 and ranks[1] <= 5:
+            # A-2-3-4-5
+            return 5
+        return min(14, ranks[-1] + 4)
+
+    @property
+    def category(self) -> int:
+        """
+        役
+        """
+        return self >> 24
+
+    @property
+    def kickers(self) -> List[int]:
+        """
+        キッカーのランクの強さ
+        (ストレートは一番上のランクのみ)
+        """
+        r = []
+        for i in range(5):
+            o = (self >> (20 - i * 4)) & 0xF
+            if o == 0:
+                break
+            r.append(o)
+        return r
+
+
+class HandState:
+    """
+    差分更新する判定状態
+
+    ランクごとの枚数、スートごとの枚数、ランクのビットマスク、ランクの素数積を
+    カードの追加・削除のたびに更新し、5枚の時の役をテーブル1回で返す
+    """
+
+    __slots__ = ("__rankCount", "__suitCount", "__rankMask", "__key", "__joker", "__len")
+
+    def __init__(self, codes: Iterable[int] = ()) -> None:
+        self.__rankCount: List[int] = [0] * 13
+        self.__suitCount: List[int] = [0] * 4
+        self.__rankMask: int = 0
+        self.__key: int = 1
+        self.__joker: int = 0
+        self.__len: int = 0
+
+        self.reset(codes)
+
+    def __len__(self) -> int:
+        return self.__len
+
+    def reset(self, codes: Iterable[int] = ()) -> None:
+        """
+        リセット
+        """
+        self.__rankCount = [0] * 13
+        self.__suitCount = [0] * 4
+        self.__rankMask = 0
+        self.__key = 1
+        self.__joker = 0
+        self.__len = 0
+        for code in codes:
+            self.add(code)
+
+    def add(self, code: int) -> None:
+        """
+        カード追加(カード番号)
+        """
+        self.__len += 1
+        if code >= Card.CODE_JOKER:
+            self.__joker += 1
+            self.__key *= Poker._RANK_PRIME["Joker"]
+            return
+        r = code % 13
+        self.__rankCount[r] += 1
+        self.__rankMask |= 1 << r
+        self.__suitCount[code // 13] += 1
+        self.__key *= Poker._RANK_PRIME[cast(ta_rank_char, r + 1)]
+
+    def remove(self, code: int) -> None:
+        """
+        カード削除(カード番号)
+        """
+        self.__len -= 1
+        if code >= Card.CODE_JOKER:
+            self.__joker -= 1
+            self.__key //= Poker._RANK_PRIME["Joker"]
+            return
+        r = code % 13
+        self.__rankCount[r] -= 1
+        if self.__rankCount[r] == 0:
+            self.__rankMask &= ~(1 << r)
+        self.__suitCount[code // 13] -= 1
+        self.__key //= Poker._RANK_PRIME[cast(ta_rank_char, r + 1)]
+
+    def _lookup(self, key: int, flushSuit: int) -> Tuple[int, Tuple[Union[int, str], ...]]:
+        """
+        テーブルを引く
+        (flushSuitはフラッシュでなければ-1)
+        """
+        if Poker._rankTable is None:
+            Poker._buildTable()
+        v = None
+        if flushSuit >= 0:
+            v = cast(Dict[int, Tuple[int, Tuple[Union[int, str], ...]]], Poker._flushTable).get(key)
+        if v is None:
+            v = cast(Dict[int, Tuple[int, Tuple[Union[int, str], ...]]], Poker._rankTable).get(key)
+        if v is None:
+            raise ValueError("判定できない手札です")
+        return v
+
+    def _flushSuit(self, suitCount: List[int], n: int) -> int:
+        """
+        フラッシュのスート番号
+        (ジョーカー以外が全て同じスートでなければ-1)
+        """
+        for i, sc in enumerate(suitCount):
+            if sc:
+                return i if sc == n else -1
+        return -1
+
+    @property
+    def category(self) -> int:
+        """
+        現在の役
+        (5枚の時のみ)
+        """
+        if self.__len != 5:
+            raise ValueError(f"不正なカード数: {self.__len}")
+        return self._lookup(
+            self.__key, self._flushSuit(self.__suitCount, 5 - self.__joker)
+        )[0]
+
+    @property
+    def strength(self) -> HandStrength:
+        """
+        現在の役の強さ
+        (5枚の時のみ)
+        """
+        if self.__len != 5:
+            raise ValueError(f"不正なカード数: {self.__len}")
+        suit = self._flushSuit(self.__suitCount, 5 - self.__joker)
+        j, ranks = self._lookup(self.__key, suit)
+        return HandStrength.fromRanks(
+            j, [14 if r == 1 else cast(int, r) for r in ranks], 4 - suit
+        )
+
+    def categoryAfterSwap(self, outCode: int, inCode: int) -> int:
+        """
+        1枚入れ替えた場合の役
+        (状態は変更しない)
+        """
+        if self.__len != 5:
+            raise ValueError(f"不正なカード数: {self.__len}")
+        key = self.__key
+        joker = self.__joker
+        suitCount = self.__suitCount.copy()
+        if outCode >= Card.CODE_JOKER:
+            key //= Poker._RANK_PRIME["Joker"]
+            joker -= 1
+        else:
+            key //= Poker._RANK_PRIME[cast(ta_rank_char, outCode % 13 + 1)]
+            suitCount[outCode // 13] -= 1
+        if inCode >= Card.CODE_JOKER:
+            key *= Poker._RANK_PRIME["Joker"]
+            joker += 1
+        else:
+            key *= Poker._RANK_PRIME[cast(ta_rank_char, inCode % 13 + 1)]
+            suitCount[inCode // 13] += 1
+        return self._lookup(key, self._flushSuit(suitCount, 5 - joker))[0]
+
+    @property
+    def rankCount(self) -> Tuple[int, ...]:
+        """
+        ランクごとの枚数(A, 2, ..., K)
+        """
+        return tuple(self.__rankCount)
+
+    @property
+    def suitCount(self) -> Tuple[int, ...]:
+        """
+        スートごとの枚数(s, h, d, c)
+        """
+        return tuple(self.__suitCount)
+
+    @property
+    def rankMask(self) -> int:
+        """
+        ランクのビットマスク(bit0: A ～ bit12: K)
+        """
+        return self.__rankMask
+
+    @property
+    def jokerCount(self) -> int:
+        """
+        ジョーカーの枚数
+        """
+        return self.__joker
+
+
+class JudgeCache:
+    """
+    役判定のキャッシュ
+
+    手札のビットマスクをキーにしたLRU
+    (maxSize=0で無効)
+    """
+
+    __slots__ = ("__data", "__maxSize", "hits", "misses", "evictions")
+
+    def __init__(self, maxSize: int = 1 << 16) -> None:
+        self.__data: "OrderedDict[int, Tuple[int, Tuple[Card, ...]]]" = OrderedDict()
+        self.__maxSize: int = maxSize
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __len__(self) -> int:
+        return len(self.__data)
+
+    def get(self, key: int) -> Optional[ta_judgement]:
+        """
+        取得
+        (無ければNone)
+        """
+        v = self.__data.get(key)
+        if v is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__data.move_to_end(key)
+        return cast(ta_judgement, (v[0], list(v[1])))
+
+    def put(self, key: int, judge: ta_judgement) -> None:
+        """
+        登録
+        """
+        if self.__maxSize <= 0:
+            return
+        self.__data[key] = (judge[0], tuple(judge[1]))
+        self.__data.move_to_end(key)
+        while len(self.__data) > self.__maxSize:
+            self.__data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        全削除
+        (統計もリセット)
+        """
+        self.__data.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def info(self) -> Dict[str, int]:
+        """
+        統計
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.__data),
+            "maxSize": self.__maxSize
+        }
+
+    @property
+    def maxSize(self) -> int:
+        """
+        最大件数
+        """
+        return self.__maxSize
+
+    @maxSize.setter
+    def maxSize(self, maxSize: int) -> None:
+        self.__maxSize = maxSize
+        while len(self.__data) > max(maxSize, 0):
+            self.__data.popitem(last=False)
+            self.evictions += 1
+
+
+class DiscardResult(NamedTuple):
+    """
+    カード交換の計算結果
+    * hold: 残すカードのビットマスク(bit i: cardDeck.get(i))
+    * discard: 捨てるカードのインデックス
+    * ev: 配当の期待値
+    * distribution: 交換後の役ごとの確率
+    """
+    hold: int
+    discard: List[int]
+    ev: float
+    distribution: List[float]
+
+
+class DiscardEstimate(NamedTuple):
+    """
+    カード交換の推定結果(モンテカルロ法)
+    * hold: 残すカードのビットマスク(bit i: cardDeck.get(i))
+    * discard: 捨てるカードのインデックス
+    * ev: 配当の期待値の推定値
+    * interval: 期待値の95%信頼区間(下限, 上限)
+    * samples: 試行回数
+    """
+    hold: int
+    discard: List[int]
+    ev: float
+    interval: Tuple[float, float]
+    samples: int
+
+
+class WorkerPool(NamedTuple):
+    """
+    常駐プロセスプール(Poker.executorの戻り値)
+    * executor: プロセスプール
+    * shared: 各プロセスが参照している共有メモリ
+    * slots: 共有メモリの空いている枠の位置
+    * workers: プロセス数
+    """
+    executor: futures.ProcessPoolExecutor
+    shared: shared_memory.SharedMemory
+    slots: "queue.Queue[int]"
+    workers: int
+
+
+class BestHandFuture(futures.Future):
+    """
+    asyncBestHandの計算結果
+
+    concurrent.futures.Futureと同じように使える
+    (計算中でもcancelでき、計算は次の区切りで打ち切る)
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._started = False
+        self._progress = 0.0
+        self._progressCallbacks: List[Callable[[float], None]] = []
+
+    def running(self) -> bool:
+        """
+        計算中か
+        """
+        return self._started and not self.done()
+
+    def add_progress_callback(self, fn: Callable[[float], None]) -> None:
+        """
+        進捗(0～1)の通知先の追加
+        (計算しているスレッドから呼ばれる)
+        """
+        self._progressCallbacks.append(fn)
+
+    def _setProgress(self, progress: float) -> None:
+        """
+        進捗の更新(計算側から呼ぶ)
+
+        cancelされていればCancelledErrorを投げて計算を打ち切らせる
+        """
+        if self.cancelled():
+            raise futures.CancelledError()
+        self._progress = progress
+        for fn in list(self._progressCallbacks):
+            fn(progress)
+
+    @property
+    def progress(self) -> float:
+        """
+        進捗(0～1)
+        """
+        return self._progress
+
+
 class Poker:
     """
     ポーカーの判定、処理クラス
 
-    (ジョーカーは1枚までしか対応していません)
+    (判定の参照実装のみジョーカーは1枚までしか対応していません)
     """
 
     _TRANS_DICT: Dict[int, str] = {
@@ -483,6 +1185,101 @@ class Poker:
         19: "ファイブカード"
     }
 
+    # 役ごとの配当(カード交換の期待値計算の既定値)
+    PAYOFF_DEFAULT: Final[Tuple[float, ...]] = (
+        0, 1, 1, 2, 2, 2, 3, 3, 5, 5,
+        7, 7, 20, 20, 50, 50, 100, 800, 200
+    )
+
+    # ランクごとの素数(テーブルのキー用)
+    _RANK_PRIME: Final[Dict[Union[ta_rank_char, ta_joker], int]] = {
+        1: 2, 2: 3, 3: 5, 4: 7, 5: 11, 6: 13, 7: 17,
+        8: 19, 9: 23, 10: 29, 11: 31, 12: 37, 13: 41,
+        "Joker": 43
+    }
+
+    # カード番号ごとのランクの素数、スートのビット(ジョーカーは0)、ランク
+    # (judgementTable用)
+    _CODE_PRIME: Final[Tuple[int, ...]] = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41) * 4 + (43, 43)
+    _CODE_SUIT_BIT: Final[Tuple[int, ...]] = (1,) * 13 + (2,) * 13 + (4,) * 13 + (8,) * 13 + (0, 0)
+    _CODE_RANK: Final[Tuple[Union[int, str], ...]] = tuple(range(1, 14)) * 4 + ("Joker", "Joker")
+
+    # ランク分布(枚数の降順)ごとの役
+    _HIST_PATTERN: Final[Tuple[Dict[Tuple[int, ...], int], ...]] = (
+        {
+            (4, 1): 13, (3, 2): 11, (3, 1, 1): 5,
+            (2, 2, 1): 3, (2, 1, 1, 1): 2, (1, 1, 1, 1, 1): 0
+        },
+        {
+            (4,): 18, (3, 1): 12, (2, 2): 10,
+            (2, 1, 1): 4, (1, 1, 1, 1): 1
+        }
+    )
+
+    # ストレートになるランクのビットマスク(ジョーカーの枚数ごと)
+    # (参照実装に合わせてジョーカーとA-3-4-5はストレートにしない)
+    _STRAIGHT_MASK: Final[Tuple[frozenset, ...]] = (
+        frozenset(
+            sum(1 << o for o in ((14, 2, 3, 4, 5) if top == 5 else range(top-4, top+1)))
+            for top in range(5, 15)
+        ),
+        frozenset(
+            sum(1 << o for o in v)
+            for top in range(5, 15)
+            for v in combinations((14, 2, 3, 4, 5) if top == 5 else range(top-4, top+1), 4)
+            if v != (14, 3, 4, 5)
+        )
+    )
+
+    _engine: ClassVar[ta_engine] = "table"
+
+    # 役判定キャッシュ
+    cache: ClassVar[JudgeCache] = JudgeCache()
+
+    # lowStrength用(ローボールの種類 → (フラッシュ以外, フラッシュ))
+    _lowTable: ClassVar[Dict[str, Tuple[Dict[int, int], Dict[int, int]]]] = {}
+
+    # bestStrength用(ランクの組み合わせ, 同じスートのランク)
+    _bestTable: ClassVar[Optional[Tuple[Dict[int, int], Dict[Tuple[int, int], int]]]] = None
+
+    # judgementBatch用(numpy配列)
+    _BATCH_POW: ClassVar[Any] = None if np is None else 5 ** np.arange(14, dtype=np.int64)
+    _batchTable: ClassVar[Optional[Tuple[Any, Any, Any, Any]]] = None
+
+    # discardAnalysis用((n, k) → 組み合わせのインデックス)
+    _combinationCache: ClassVar[Dict[Tuple[int, int], Any]] = {}
+
+    # omahaBatch用((手札枚数, 場札枚数) → 組み合わせのインデックス)
+    _omahaIndexCache: ClassVar[Dict[Tuple[int, int], Any]] = {}
+
+    # 最適交換テーブル(ヘッダー: 識別子, 版, ジョーカー枚数, 配当)
+    # 本体はC(54, 5)個の残すカードのビットマスク(0xFF: 未計算)
+    _DISCARD_HEADER: Final[struct.Struct] = struct.Struct("<4sBB2x19d")
+    _DISCARD_MAGIC: Final[bytes] = b"PKDT"
+    _DISCARD_VERSION: Final[int] = 1
+    _DISCARD_SIZE: Final[int] = math.comb(Card.CODE_MAX, 5)
+    _discardTable: ClassVar[Optional[Tuple[mmap.mmap, int, Tuple[float, ...]]]] = None
+
+    # bestHand用の常駐プロセスプールと共有メモリ(初回使用時に起動)
+    _pool: ClassVar[Optional[WorkerPool]] = None
+    _atexitRegistered: ClassVar[bool] = False
+    _poolLock: ClassVar[threading.Lock] = threading.Lock()
+
+    # asyncBestHand用(計算を待つスレッドと計算中の結果)
+    _threadExecutor: ClassVar[Optional[futures.ThreadPoolExecutor]] = None
+    _tasks: ClassVar[set] = set()
+
+    # 常駐プロセスと共有するメモリ
+    # (件数, 判定テーブル, 探索ごとの手札と候補のカードの枠)
+    _SHARED_HEADER: Final[struct.Struct] = struct.Struct("<qq")
+    _SHARED_SLOT_SIZE: Final[int] = 64
+    _SHARED_SLOT_COUNT: Final[int] = 8
+    # 常駐プロセス側(キー, 値, フラッシュのキー, フラッシュの値, 共有メモリ全体)
+    _sharedWorker: ClassVar[Optional[shared_memory.SharedMemory]] = None
+    _sharedView: ClassVar[Optional[Tuple[memoryview, memoryview, memoryview, memoryview, memoryview]]] = None
+    _rankTable: ClassVar[Optional[Dict[int, Tuple[int, Tuple[Union[int, str], ...]]]]] = None
+    _flushTable: ClassVar[Optional[Dict[int, Tuple[int, Tuple[Union[int, str], ...]]]]] = None
+
     @classmethod
     def get_trans(cls, transId: int) -> Tuple[str, str]:
         """
@@ -506,42 +1303,438 @@ class Poker:
         * 0: 引き分け
         * -1: (引数)右の勝利
         """
-        judge1 = cls.judgement(cardDeck1)
-        judge2 = cls.judgement(cardDeck2)
+        s1 = cls.strength(cardDeck1)
+        s2 = cls.strength(cardDeck2)
 
-        p1 = judge1[0]
-        p2 = judge2[0]
-
-        if p1 > p2:
+        if s1 > s2:
             # 左の勝ち
-            return 1, p1, p2
-        elif p1 < p2:
+            return 1, s1.category, s2.category
+        elif s1 < s2:
             # 右の勝ち
-            return -1, p1, p2
+            return -1, s1.category, s2.category
+        # 引き分け
+        return 0, s1.category, s2.category
+
+    @classmethod
+    def showdown(cls, cardDecks: List[CardDeck], mode: ta_mode = "high") -> List[List[int]]:
+        """
+        複数人でのポーカー勝負
+
+        各デッキを一度だけ判定して強い順に並べる
+        (引き分けは同じグループ、値はcardDecksのインデックス)
+        * high: 通常
+        * 2-7, A-5: ローボール
+        """
+        if mode == "high":
+            strengths: List[int] = [cls.strength(d) for d in cardDecks]
         else:
-            # 引き分け
-            p1 = judge1[1][0]
-            p2 = judge2[1][0]
-
-            if judge1[0] == 17:
-                # ロイヤルストレートフラッシュの場合
-                if p1.suit_power > p2.suit_power:
-                    # 左の勝ち
-                    return 1, judge1[0], judge2[0]
-                elif p1.suit_power < p2.suit_power:
-                    # 右の勝ち
-                    return -1, judge1[0], judge2[0]
-                raise ValueError("ロイヤルストレートフラッシュの勝敗判定に失敗しました")
-
-            if p1 > p2:
-                # 左の勝ち
-                return 1, judge1[0], judge2[0]
-            elif p1 < p2:
-                # 右の勝ち
-                return -1, judge1[0], judge2[0]
+            strengths = [cls.lowStrength(d, mode) for d in cardDecks]
+        order = sorted(range(len(cardDecks)), key=strengths.__getitem__, reverse=True)
+
+        ranking: List[List[int]] = []
+        prev = None
+        for i in order:
+            if strengths[i] != prev:
+                ranking.append([])
+                prev = strengths[i]
+            ranking[-1].append(i)
+        return ranking
+
+    @classmethod
+    def canonicalize(cls, cardDeck: CardDeck, dead: Optional[Iterable[Card]] = None) -> Tuple[Tuple[int, ...], Tuple[int, ...], Dict[ta_suit_char, ta_suit_char]]:
+        """
+        スートの入れ替えで同じになる手札をまとめる
+
+        (手札のカード番号, 死に札のカード番号, スートの対応(元→変換後))を返す
+        カード番号は昇順
+        """
+        deadCodes = [] if dead is None else [c.code for c in dead]
+        hand, deadHand, perm = cls.canonicalCodes(cardDeck.codes, deadCodes)
+        return hand, deadHand, {
+            Card._SUIT_CHAR_TYPE[k]: Card._SUIT_CHAR_TYPE[v] for k, v in perm.items()
+        }
+
+    @staticmethod
+    def canonicalCodes(codes: Iterable[int], dead: Iterable[int] = ()) -> Tuple[Tuple[int, ...], Tuple[int, ...], Dict[int, int]]:
+        """
+        スートの入れ替えで同じになる手札をまとめる(カード番号)
+
+        スートごとの(手札のランク, 死に札のランク)の降順にスートを振り直す
+        (スートの対応はスート番号で返す)
+        """
+        codes = tuple(codes)
+        dead = tuple(dead)
+
+        handMask = [0] * 4
+        deadMask = [0] * 4
+        for c in codes:
+            if c < Card.CODE_JOKER:
+                handMask[c // 13] |= 1 << (c % 13)
+        for c in dead:
+            if c < Card.CODE_JOKER:
+                deadMask[c // 13] |= 1 << (c % 13)
+
+        order = sorted(range(4), key=lambda i: (handMask[i], deadMask[i]), reverse=True)
+        perm = {s: i for i, s in enumerate(order)}
+
+        def convert(lst: Tuple[int, ...]) -> Tuple[int, ...]:
+            return tuple(sorted(
+                c if c >= Card.CODE_JOKER else perm[c // 13] * 13 + c % 13
+                for c in lst
+            ))
+
+        return convert(codes), convert(dead), perm
+
+    @classmethod
+    def bestStrength(cls, cardDeck: CardDeck, board: Optional[CardDeck] = None) -> HandStrength:
+        """
+        5～7枚の中で最も強い5枚の役の強さ
+        (boardを渡すと場札も含めて計算)
+
+        ランクの組み合わせとスートごとのランクのテーブルを引く
+        """
+        if board is not None:
+            cardDeck = cardDeck.copy()
+            for c in board.cardList:
+                cardDeck.add(c)
+        cl = cardDeck.cardList
+        n = len(cl)
+        if n == 5:
+            return cls.strength(cardDeck)
+        if not 5 < n <= 7:
+            raise ValueError(f"不正なカード数: {n}")
+        if cls._bestTable is None:
+            cls._buildBestTable()
+        rankTable, flushTable = cast(Tuple[Dict[int, int], Dict[Tuple[int, int], int]], cls._bestTable)
+
+        key = 1
+        inJoker = 0
+        suitMask = [0] * 4
+        for c in cl:
+            key *= cls._RANK_PRIME[c.rank]
+            if c.rank == "Joker":
+                inJoker += 1
             else:
-                # 引き分け
-                return 0, judge1[0], judge2[0]
+                suitMask[c.code // 13] |= 1 << (c.code % 13)
+
+        v = rankTable[key]
+        for i, m in enumerate(suitMask):
+            if bin(m).count("1") + inJoker >= 5:
+                f = flushTable[(m, inJoker)]
+                if f >> 24 == 17:
+                    # ロイヤルストレートフラッシュはスートの強さも比較
+                    f |= 4 - i
+                if f > v:
+                    v = f
+        return HandStrength(v)
+
+    @classmethod
+    def _buildBestTable(cls) -> None:
+        """
+        bestStrength用のテーブル作成
+
+        6枚、7枚の組み合わせは1枚除いた組み合わせのうち最も強いもの
+        """
+        if cls._rankTable is None:
+            cls._buildTable()
+        table5 = cast(Dict[int, Tuple[int, Tuple[Union[int, str], ...]]], cls._rankTable)
+        flush5 = cast(Dict[int, Tuple[int, Tuple[Union[int, str], ...]]], cls._flushTable)
+
+        def power(v: Tuple[int, Tuple[Union[int, str], ...]]) -> int:
+            return HandStrength.fromRanks(v[0], [14 if r == 1 else cast(int, r) for r in v[1]])
+
+        jokerPrime = cls._RANK_PRIME["Joker"]
+
+        # ランクの組み合わせ(素数積)
+        rankTable: Dict[int, int] = {k: power(v) for k, v in table5.items()}
+        for n in (6, 7):
+            for inJoker in range(3):
+                for ranks in combinations_with_replacement(range(1, 14), n-inJoker):
+                    if any(ranks.count(r) > 4 for r in set(ranks)):
+                        continue
+                    key = jokerPrime ** inJoker
+                    for r in ranks:
+                        key *= cls._RANK_PRIME[r]
+                    best = 0
+                    for r in set(ranks):
+                        best = max(best, rankTable[key // cls._RANK_PRIME[r]])
+                    if inJoker:
+                        best = max(best, rankTable[key // jokerPrime])
+                    rankTable[key] = best
+
+        # 同じスートのランク(ビットマスク, ジョーカーの枚数)
+        flushTable: Dict[Tuple[int, int], int] = {}
+        for n in (5, 6, 7):
+            for inJoker in range(3):
+                for ranks in combinations(range(13), n-inJoker):
+                    m = sum(1 << r for r in ranks)
+                    if n == 5:
+                        key = jokerPrime ** inJoker
+                        for r in ranks:
+                            key *= cls._RANK_PRIME[r+1]
+                        flushTable[(m, inJoker)] = power(flush5[key])
+                        continue
+                    best = 0
+                    for r in ranks:
+                        best = max(best, flushTable[(m & ~(1 << r), inJoker)])
+                    if inJoker:
+                        best = max(best, flushTable[(m, inJoker-1)])
+                    flushTable[(m, inJoker)] = best
+
+        cls._bestTable = (rankTable, flushTable)
+
+    @classmethod
+    def showdownHiLo(cls, cardDecks: List[CardDeck], pot: float = 1.0, lowMode: ta_low_mode = "A-5", qualifier: Optional[int] = 8) -> List[float]:
+        """
+        ハイローでの複数人勝負
+
+        ハイとローで半分ずつ分けた配当をcardDecksの順で返す
+        (同じ強さの場合は等分)
+        qualifierはローの条件(一番上のカードがこれ以下かつ役なし)
+        条件を満たすローがいない場合はハイが全て取る
+        """
+        n = len(cardDecks)
+        shares = [0.0] * n
+        if n == 0:
+            return shares
+
+        highs: List[int] = []
+        lows: List[int] = []
+        for d in cardDecks:
+            h, l = cls.hiLoStrength(d, lowMode)
+            highs.append(h)
+            lows.append(l)
+
+        # ロー条件
+        top = (1 << 24) - 1
+        lowIdx = []
+        for i, l in enumerate(lows):
+            bad = top - l
+            if qualifier is None or (bad >> 20 == 0 and (bad >> 16) & 0xF <= qualifier):
+                lowIdx.append(i)
+
+        best = max(highs)
+        highWin = [i for i in range(n) if highs[i] == best]
+        highPot = pot if not lowIdx else pot / 2
+        for i in highWin:
+            shares[i] += highPot / len(highWin)
+
+        if lowIdx:
+            best = max(lows[i] for i in lowIdx)
+            lowWin = [i for i in lowIdx if lows[i] == best]
+            for i in lowWin:
+                shares[i] += (pot - highPot) / len(lowWin)
+        return shares
+
+    @classmethod
+    def hiLoStrength(cls, cardDeck: CardDeck, lowMode: ta_low_mode = "A-5") -> Tuple[HandStrength, int]:
+        """
+        ハイとローの強さ
+
+        ランクの素数積とフラッシュ判定を一度だけ計算して両方のテーブルを引く
+        """
+        cl = cardDeck.cardList
+        if len(cl) != 5:
+            raise ValueError(f"不正なカード数: {len(cl)}")
+        if cls._rankTable is None:
+            cls._buildTable()
+        low = cls._lowTable.get(lowMode)
+        if low is None:
+            low = cls._buildLowTable(lowMode)
+        rankTable = cast(Dict[int, Tuple[int, Tuple[Union[int, str], ...]]], cls._rankTable)
+        flushTable = cast(Dict[int, Tuple[int, Tuple[Union[int, str], ...]]], cls._flushTable)
+
+        key = 1
+        suit = None
+        suitPower = 0
+        flush = True
+        for c in cl:
+            r = c.rank
+            key *= cls._RANK_PRIME[r]
+            if r == "Joker":
+                continue
+            if suit is None:
+                suit = c.suit
+                suitPower = c.suit_power
+            elif suit != c.suit:
+                flush = False
+
+        v = flushTable.get(key) if flush else None
+        if v is None:
+            v = rankTable[key]
+        high = HandStrength.fromRanks(
+            v[0], [14 if r == 1 else cast(int, r) for r in v[1]], suitPower
+        )
+
+        lowRank, lowFlush = low
+        if flush and key in lowFlush:
+            return high, lowFlush[key]
+        return high, lowRank[key]
+
+    @classmethod
+    def lowStrength(cls, cardDeck: CardDeck, mode: ta_low_mode = "2-7") -> int:
+        """
+        ローボールでの強さ
+        (大きいほど強い)
+        * 2-7: Aは常に最上位、ストレートとフラッシュも役になる
+        * A-5: Aは最下位、ストレートとフラッシュは無視
+
+        ジョーカーは最も弱くなるカードとして扱う
+        """
+        cl = cardDeck.cardList
+        if len(cl) != 5:
+            raise ValueError(f"不正なカード数: {len(cl)}")
+        table = cls._lowTable.get(mode)
+        if table is None:
+            table = cls._buildLowTable(mode)
+        rankTable, flushTable = table
+
+        key = 1
+        suit = None
+        flush = True
+        for c in cl:
+            r = c.rank
+            key *= cls._RANK_PRIME[r]
+            if r == "Joker":
+                continue
+            if suit is None:
+                suit = c.suit
+            elif suit != c.suit:
+                flush = False
+
+        if flush and key in flushTable:
+            return flushTable[key]
+        return rankTable[key]
+
+    @classmethod
+    def _buildLowTable(cls, mode: ta_low_mode) -> Tuple[Dict[int, int], Dict[int, int]]:
+        """
+        ローボール用のテーブル作成
+
+        (ランクの素数積 → 強さ)をフラッシュ以外とフラッシュで作る
+        ジョーカー入りは1枚を各ランクに置き換えたうちで最も強いもの
+        """
+        if mode not in ("2-7", "A-5"):
+            raise ValueError(f"不明なローボール: {mode}")
+        aceLow = mode == "A-5"
+
+        # (枚数の降順)ごとの役の悪さ
+        pattern: Dict[Tuple[int, ...], int] = {
+            (1, 1, 1, 1, 1): 0, (2, 1, 1, 1): 1, (2, 2, 1): 2,
+            (3, 1, 1): 3, (3, 2): 6, (4, 1): 7
+        }
+
+        def badness(ranks: Tuple[int, ...], flush: bool) -> int:
+            values = [1 if aceLow and r == 1 else 14 if r == 1 else r for r in ranks]
+            count = {v: values.count(v) for v in values}
+            order = sorted(count, key=lambda v: (count[v], v), reverse=True)
+            j = pattern[tuple(count[v] for v in order)]
+            if not aceLow and j == 0:
+                straight = order[0] - order[-1] == 4
+                if straight and flush:
+                    j = 8
+                elif flush:
+                    j = 5
+                elif straight:
+                    j = 4
+            v = j << 20
+            for i, o in enumerate(order):
+                v |= o << (16 - i * 4)
+            return v
+
+        def keyOf(ranks: Tuple[int, ...], inJoker: int) -> int:
+            key = cls._RANK_PRIME["Joker"] ** inJoker
+            for r in ranks:
+                key *= cls._RANK_PRIME[r]
+            return key
+
+        rankTable: Dict[int, int] = {}
+        flushTable: Dict[int, int] = {}
+        for inJoker in range(6):
+            for ranks in combinations_with_replacement(range(1, 14), 5-inJoker):
+                if any(ranks.count(r) > 4 for r in set(ranks)):
+                    continue
+                key = keyOf(ranks, inJoker)
+                isFlush = not aceLow and len(set(ranks)) == len(ranks)
+                if inJoker == 0:
+                    rankTable[key] = badness(ranks, False)
+                    if isFlush:
+                        flushTable[key] = badness(ranks, True)
+                    continue
+
+                # ジョーカーは最も弱くなるカード
+                sub = key // cls._RANK_PRIME["Joker"]
+                cand = [
+                    rankTable[sub * cls._RANK_PRIME[r]] for r in range(1, 14)
+                    if ranks.count(r) < 4
+                ]
+                rankTable[key] = min(cand)
+                if isFlush:
+                    flushTable[key] = min(cand + [
+                        flushTable[sub * cls._RANK_PRIME[r]] for r in range(1, 14)
+                        if r not in ranks
+                    ])
+
+        # 大きいほど強い値にする
+        top = (1 << 24) - 1
+        table = (
+            {k: top - v for k, v in rankTable.items()},
+            {k: top - v for k, v in flushTable.items()}
+        )
+        cls._lowTable[mode] = table
+        return table
+
+    @classmethod
+    def strength(cls, cardDeck: CardDeck) -> HandStrength:
+        """
+        役の強さ
+        (キッカーまで含めて比較できる整数)
+        """
+        return HandStrength.fromJudgement(cls.judgement(cardDeck))
+
+    @classmethod
+    def setEngine(cls, engine: ta_engine) -> None:
+        """
+        役判定の実装切り替え
+        * table: テーブル参照(既定)
+        * histogram: ランク分布の一括計算
+        * reference: 判定関数の連鎖(参照実装)
+        """
+        if engine not in ("table", "histogram", "reference"):
+            raise ValueError(f"不明な判定実装: {engine}")
+        cls._engine = engine
+        cls.cache.clear()
+
+    @classmethod
+    def warmup(cls) -> None:
+        """
+        判定テーブルを先に作っておく
+        (初回の判定や時間制限付きの計算で作成時間がかからないように)
+        """
+        if cls._rankTable is None:
+            cls._buildTable()
+        if np is not None and cls._batchTable is None:
+            cls._buildBatchTable()
+
+    @classmethod
+    def setCacheSize(cls, maxSize: int) -> None:
+        """
+        役判定キャッシュの最大件数設定
+        (0で無効)
+        """
+        cls.cache.maxSize = maxSize
+
+    @classmethod
+    def cacheInfo(cls) -> Dict[str, int]:
+        """
+        役判定キャッシュの統計
+        * hits: ヒット数
+        * misses: ミス数
+        * evictions: 追い出し数
+        * size: 現在の件数
+        * maxSize: 最大件数
+        """
+        return cls.cache.info()
 
     @classmethod
     def judgement(cls, cardDeck: CardDeck) -> ta_judgement:
@@ -561,6 +1754,358 @@ class Poker:
 
         ※ジョーカー混入時は(判定-1)を返却
         """
+        cache = cls.cache
+        key = 0
+        if cache.maxSize > 0:
+            key = cardDeck.mask
+            r = cache.get(key)
+            if r is not None:
+                return r
+
+        if cls._engine == "table":
+            r = cls.judgementTable(cardDeck)
+        elif cls._engine == "histogram":
+            r = cls.judgementHistogram(cardDeck)
+        else:
+            r = cls.judgementReference(cardDeck)
+
+        if cache.maxSize > 0:
+            cache.put(key, r)
+        return r
+
+    @classmethod
+    def judgementTable(cls, cardDeck: CardDeck) -> ta_judgement:
+        """
+        役判定(テーブル参照)
+
+        ランクの素数積をキーにして役とキッカーのランクを引く
+        (フラッシュは専用テーブル、カード番号ごとの値は事前計算)
+        """
+        cl: Optional[List[Card]] = None
+        if cardDeck.storage == "array":
+            codes: Sequence[int] = cardDeck.codes
+        else:
+            cl = cardDeck.cardList
+            codes = list(map(Card.codeOf, cl))
+        if len(codes) != 5:
+            return cls.judgementReference(cardDeck)
+        if cls._rankTable is None:
+            cls._buildTable()
+        # (型を実行時に組み立てないように文字列で指定)
+        rankTable = cast("Dict[int, Tuple[int, Tuple[Union[int, str], ...]]]", cls._rankTable)
+        flushTable = cast("Dict[int, Tuple[int, Tuple[Union[int, str], ...]]]", cls._flushTable)
+
+        a, b, c, d, e = codes
+        prime = cls._CODE_PRIME
+        key = prime[a] * prime[b] * prime[c] * prime[d] * prime[e]
+        bit = cls._CODE_SUIT_BIT
+        suits = bit[a] | bit[b] | bit[c] | bit[d] | bit[e]
+
+        v = None
+        if not suits & (suits - 1):
+            # ジョーカー以外のスートが1種類以下
+            v = flushTable.get(key)
+        if v is None:
+            v = rankTable.get(key)
+        if v is None:
+            # テーブル対象外(同じカードが複数あるなど)
+            return cls.judgementReference(cardDeck)
+
+        # キッカーはランクごとに一番強いスート(カード番号が一番小さいもの)
+        rank = cls._CODE_RANK
+        if cl is None:
+            best = {rank[x]: Card.fromCode(x) for x in sorted(codes, reverse=True)}
+        else:
+            best = {rank[x]: card for x, card in sorted(zip(codes, cl), key=itemgetter(0), reverse=True)}
+        return cast(ta_judgement, (v[0], [best[r] for r in v[1]]))
+
+    @classmethod
+    def judgementBatch(cls, codes: Any) -> Tuple[Any, Any]:
+        """
+        役判定(numpyでの一括計算)
+
+        codesはカード番号の(N, 5)配列
+        役の配列(int8)とHandStrengthの配列(int32)を返す
+        (numpyが必要)
+        """
+        if np is None:
+            raise ImportError("judgementBatchにはnumpyが必要です")
+        codes = np.asarray(codes, dtype=np.int64)
+        if codes.ndim != 2 or codes.shape[1] != 5:
+            raise ValueError(f"不正な配列の形: {codes.shape}")
+        if cls._batchTable is None:
+            cls._buildBatchTable()
+        keys, values, flushKeys, flushValues = cast(Tuple[Any, Any, Any, Any], cls._batchTable)
+
+        strength = np.empty(len(codes), dtype=np.int32)
+        # 一時配列が大きくなりすぎないように分割
+        step = 1 << 20
+        for start in range(0, len(codes), step):
+            c = codes[start:start+step]
+            if c.size and (c.min() < 0 or c.max() >= Card.CODE_MAX):
+                raise ValueError("不正なカード番号")
+            isJoker = c >= Card.CODE_JOKER
+
+            # ランク分布(ランクごとの枚数を5進数の各桁に積む)
+            rankIdx = np.where(isJoker, 13, c % 13)
+            key = cls._BATCH_POW[rankIdx].sum(axis=1)
+
+            # フラッシュ判定(ジョーカー以外のスートが全て同じ)
+            suit = c // 13
+            smin = np.where(isJoker, 4, suit).min(axis=1)
+            smax = np.where(isJoker, -1, suit).max(axis=1)
+            flush = smin == smax
+
+            i = np.minimum(np.searchsorted(keys, key), len(keys) - 1)
+            if not np.all(keys[i] == key):
+                raise ValueError("判定できない手札が含まれています")
+            v = values[i]
+
+            fi = np.minimum(np.searchsorted(flushKeys, key), len(flushKeys) - 1)
+            useFlush = flush & (flushKeys[fi] == key)
+            v = np.where(useFlush, flushValues[fi], v)
+
+            # ロイヤルストレートフラッシュはスートの強さも比較
+            royal = (v >> 24) == 17
+            v = np.where(royal, v | (4 - smin), v)
+            strength[start:start+step] = v
+
+        return (strength >> 24).astype(np.int8), strength
+
+    @classmethod
+    def omahaStrength(cls, hole: CardDeck, board: CardDeck) -> HandStrength:
+        """
+        手札から必ず2枚、場札から3枚使う場合の最も強い役の強さ
+        (オマハ、numpyが必要)
+        """
+        _, strength = cls.omahaBatch([hole.codes], [board.codes])
+        return HandStrength(int(strength[0]))
+
+    @classmethod
+    def omahaBatch(cls, holes: Any, boards: Any) -> Tuple[Any, Any]:
+        """
+        手札から必ず2枚、場札から3枚使う場合の一括計算
+
+        holesは手札のカード番号の(N, 手札枚数)配列、boardsは場札の(N, 場札枚数)配列
+        最も強い組み合わせの役の配列とHandStrengthの配列を返す
+        (numpyが必要)
+        """
+        if np is None:
+            raise ImportError("omahaBatchにはnumpyが必要です")
+        holes = np.asarray(holes, dtype=np.int64)
+        boards = np.asarray(boards, dtype=np.int64)
+        if holes.ndim != 2 or boards.ndim != 2 or len(holes) != len(boards):
+            raise ValueError(f"不正な配列の形: {holes.shape}, {boards.shape}")
+
+        idx = cls._omahaIndex(holes.shape[1], boards.shape[1])
+        codes = np.concatenate((holes, boards), axis=1)[:, idx]
+        n, m, _ = codes.shape
+        _, strength = cls.judgementBatch(codes.reshape(n * m, 5))
+        strength = strength.reshape(n, m).max(axis=1)
+        return (strength >> 24).astype(np.int8), strength
+
+    @classmethod
+    def _omahaIndex(cls, holeLen: int, boardLen: int) -> Any:
+        """
+        (手札2枚, 場札3枚)の全ての組み合わせのインデックス
+        (手札、場札の順に並べた配列用)
+        """
+        key = (holeLen, boardLen)
+        idx = cls._omahaIndexCache.get(key)
+        if idx is None:
+            if holeLen < 2 or boardLen < 3:
+                raise ValueError(f"不正なカード数: {holeLen}, {boardLen}")
+            idx = np.array([
+                h + tuple(holeLen + b for b in bd)
+                for h in combinations(range(holeLen), 2)
+                for bd in combinations(range(boardLen), 3)
+            ], dtype=np.intp)
+            cls._omahaIndexCache[key] = idx
+        return idx
+
+    @classmethod
+    def _buildBatchTable(cls) -> None:
+        """
+        judgementBatch用のテーブル作成
+
+        判定テーブルをランク分布の5進数キーで引けるソート済み配列にする
+        """
+        (keys, values), (flushKeys, flushValues) = cls._histogramTables()
+        cls._batchTable = (
+            np.array(keys, dtype=np.int64), np.array(values, dtype=np.int32),
+            np.array(flushKeys, dtype=np.int64), np.array(flushValues, dtype=np.int32)
+        )
+
+    @classmethod
+    def _histogramTables(cls) -> Tuple[Tuple[array, array], Tuple[array, array]]:
+        """
+        判定テーブルをランク分布の5進数キーの昇順に並べたもの
+        ((キー, HandStrength)をフラッシュ以外とフラッシュの2つ)
+        """
+        if cls._rankTable is None:
+            cls._buildTable()
+
+        def convert(table: Dict[int, Tuple[int, Tuple[Union[int, str], ...]]]) -> Tuple[array, array]:
+            items = []
+            for primeKey, (j, ranks) in table.items():
+                key = 0
+                for idx, r in enumerate(cls._RANK_PRIME):
+                    p = cls._RANK_PRIME[r]
+                    while primeKey % p == 0:
+                        primeKey //= p
+                        key += 5 ** (13 if r == "Joker" else idx)
+                h = HandStrength.fromRanks(
+                    j, [14 if r == 1 else cast(int, r) for r in ranks], 0
+                )
+                items.append((key, int(h)))
+            items.sort()
+            return array("q", [k for k, _ in items]), array("i", [v for _, v in items])
+
+        return (
+            convert(cast(Dict[int, Tuple[int, Tuple[Union[int, str], ...]]], cls._rankTable)),
+            convert(cast(Dict[int, Tuple[int, Tuple[Union[int, str], ...]]], cls._flushTable))
+        )
+
+    @classmethod
+    def judgementHistogram(cls, cardDeck: CardDeck) -> ta_judgement:
+        """
+        役判定(ランク分布)
+
+        ランクごとの枚数、フラッシュ判定、ストレート用のビットマスクを
+        一度の走査で作り、そこから役とキッカーを決める
+        """
+        cl = cardDeck.cardList
+        if len(cl) != 5:
+            return cls.judgementReference(cardDeck)
+
+        hist = [0] * 15
+        best: List[Optional[Card]] = [None] * 15
+        ranks: List[int] = []
+        mask = 0
+        inJoker = 0
+        suit = None
+        flush = True
+        for c in cl:
+            if c.rank == "Joker":
+                inJoker += 1
+                continue
+            o = c.rankOrder
+            if hist[o] == 0:
+                ranks.append(o)
+                mask |= 1 << o
+                best[o] = c
+            elif c.suit_power > cast(Card, best[o]).suit_power:
+                best[o] = c
+            hist[o] += 1
+            if suit is None:
+                suit = c.suit
+            elif suit != c.suit:
+                flush = False
+
+        if inJoker > 1:
+            # ジョーカー複数枚は置き換え済みのテーブルを使う
+            return cls.judgementTable(cardDeck)
+
+        # キッカーは(枚数, ランク)の降順
+        ranks.sort(key=lambda o: (hist[o], o), reverse=True)
+        kicker = [cast(Card, best[o]) for o in ranks]
+
+        j = cls._HIST_PATTERN[inJoker][tuple(hist[o] for o in ranks)]
+        if len(ranks) + inJoker == 5:
+            # 全て別ランク
+            straight = mask in cls._STRAIGHT_MASK[inJoker]
+            if flush:
+                if straight:
+                    # A入り(A-2-3-4-5も含む)、またはジョーカーと10-J-Q-K
+                    if mask & (1 << 14) or (inJoker and ranks[-1] == 10):
+                        return 17-inJoker, kicker
+                    return 15-inJoker, kicker
+                return 9-inJoker, kicker
+            if straight:
+                return 7-inJoker, kicker
+        return cast(ta_judgement, (j, kicker))
+
+    @classmethod
+    def _buildTable(cls) -> None:
+        """
+        判定テーブル作成
+
+        ジョーカー1枚までは全てのランクの組み合わせを参照実装で判定して登録する
+        ジョーカー2枚以上は1枚を各ランクに置き換えたうちで最も強いものを登録する
+        """
+        base = Trump(0)
+        rankTable: Dict[int, Tuple[int, Tuple[Union[int, str], ...]]] = {}
+        flushTable: Dict[int, Tuple[int, Tuple[Union[int, str], ...]]] = {}
+
+        def entry(ranks: Tuple[int, ...], inJoker: int, flush: bool) -> Tuple[int, Tuple[Union[int, str], ...]]:
+            cl = []
+            for i, r in enumerate(ranks):
+                suit = "s" if flush else Card._SUIT_CHAR_TYPE[i % 4]
+                cl.append(Card(suit, cast(ta_rank_char, r)))
+            for _ in range(inJoker):
+                cl.append(Card(isJoker=True))
+            j, h = cls.judgementReference(CardDeck(base, cl))
+            return j, tuple(c.rank for c in h)
+
+        for inJoker in range(2):
+            for ranks in combinations_with_replacement(range(1, 14), 5-inJoker):
+                if inJoker == 0 and ranks[0] == ranks[-1]:
+                    # 同じランク5枚は存在しない
+                    continue
+                key = 1
+                for r in ranks:
+                    key *= cls._RANK_PRIME[r]
+                key *= cls._RANK_PRIME["Joker"] ** inJoker
+
+                rankTable[key] = entry(ranks, inJoker, False)
+                if len(set(ranks)) == len(ranks):
+                    flushTable[key] = entry(ranks, inJoker, True)
+
+        def power(v: Tuple[int, Tuple[Union[int, str], ...]]) -> HandStrength:
+            return HandStrength.fromRanks(v[0], [14 if r == 1 else cast(int, r) for r in v[1]])
+
+        def substitute(ranks: Tuple[int, ...], v: Tuple[int, Tuple[Union[int, str], ...]]) -> Tuple[int, Tuple[Union[int, str], ...]]:
+            # キッカーは実際にあるカードのみ
+            real = list(ranks)
+            kicker = []
+            for r in v[1]:
+                if r in real:
+                    real.remove(cast(int, r))
+                    kicker.append(r)
+            return v[0], tuple(kicker)
+
+        jokerPrime = cls._RANK_PRIME["Joker"]
+        for inJoker in range(2, 6):
+            for ranks in combinations_with_replacement(range(1, 14), 5-inJoker):
+                sub = jokerPrime ** (inJoker-1)
+                for r in ranks:
+                    sub *= cls._RANK_PRIME[r]
+                key = sub * jokerPrime
+
+                isFlush = len(set(ranks)) == len(ranks)
+                cand = []
+                flushCand = []
+                for r in range(1, 14):
+                    k = sub * cls._RANK_PRIME[r]
+                    cand.append(rankTable[k])
+                    if isFlush and r not in ranks:
+                        flushCand.append(flushTable[k])
+
+                rankTable[key] = substitute(ranks, max(cand, key=power))
+                if isFlush:
+                    flushTable[key] = substitute(ranks, max(cand+flushCand, key=power))
+
+        cls._rankTable = rankTable
+        cls._flushTable = flushTable
+
+    @classmethod
+    def judgementReference(cls, cardDeck: CardDeck) -> ta_judgement:
+        """
+        役判定(参照実装)
+
+        判定関数を強い役から順に試す
+        (返却値はjudgementと同じ)
+        """
         tmpDeck = cardDeck.copy()
         tmpDeck.sort()
 
@@ -951,133 +2496,671 @@ class Poker:
         return r
 
     @classmethod
-    def asyncBestHand(cls, trump: Trump, cardDeck: CardDeck, callback: Callable[[List[Literal[0, 1, 2, 3, 4]]], None]) -> None:
+    def optimalDiscard(cls, trump: Trump, cardDeck: CardDeck, dead: Optional[Iterable[Card]] = None, payoff: Optional[Sequence[float]] = None) -> DiscardResult:
         """
-        現在の手からの最善手の計算
+        配当の期待値が最大になるカード交換
+        (期待値が同じ場合は残す枚数が多い方)
+        """
+        return max(
+            cls.discardAnalysis(trump, cardDeck, dead, payoff),
+            key=lambda r: (r.ev, bin(r.hold).count("1"))
+        )
 
-        非同期バージョン
-        (計算に非常に時間がかかるため)
+    @classmethod
+    def discardAnalysis(cls, trump: Trump, cardDeck: CardDeck, dead: Optional[Iterable[Card]] = None, payoff: Optional[Sequence[float]] = None) -> List[DiscardResult]:
+        """
+        全ての残し方(32通り)の交換後の役の分布と配当の期待値
+
+        山札(trumpの全カードから手札とdeadを除いたもの)からの
+        全ての引き方を数え上げる
+        (インデックスは残すカードのビットマスク、numpyが必要)
+        """
+        if np is None:
+            raise ImportError("discardAnalysisにはnumpyが必要です")
+        if len(cardDeck) != 5:
+            raise ValueError(f"不正なカード数: {len(cardDeck)}")
+        pay = np.asarray(cls.PAYOFF_DEFAULT if payoff is None else payoff, dtype=np.float64)
+        if pay.shape != (19,):
+            raise ValueError("payoffは役ごと(19個)の配当です")
+
+        hand = list(cardDeck.codes)
+        stub = np.array(cls._stubCodes(trump, hand, dead), dtype=np.int64)
+
+        results = []
+        for hold in range(32):
+            held = [hand[i] for i in range(5) if hold >> i & 1]
+            idx = cls._combinationIndex(len(stub), 5 - len(held))
+            codes = np.empty((len(idx), 5), dtype=np.int64)
+            codes[:, :len(held)] = held
+            codes[:, len(held):] = stub[idx]
+            cat, _ = cls.judgementBatch(codes)
+
+            dist = np.bincount(cat, minlength=19) / len(codes)
+            results.append(DiscardResult(
+                hold,
+                [i for i in range(5) if not hold >> i & 1],
+                float(dist @ pay),
+                dist.tolist()
+            ))
+        return results
+
+    @classmethod
+    def monteCarloDiscard(cls, trump: Trump, cardDeck: CardDeck, budget_ms: float, dead: Optional[Iterable[Card]] = None, payoff: Optional[Sequence[float]] = None, *, progress: Optional[Callable[[float], None]] = None) -> List[DiscardEstimate]:
+        """
+        全ての残し方(32通り)の配当の期待値をモンテカルロ法で推定
+
+        制限時間(ミリ秒)まで残し方を順番に回して山札からの引き方を無作為に選ぶ
+        (最低1巡は行う、インデックスは残すカードのビットマスク)
+        numpyがあれば一括計算、無ければ1つずつ判定する
+        progressには1巡ごとに経過時間の割合(0～1)を渡す
+        (判定テーブルは制限時間を測り始める前に作る)
+        """
+        if len(cardDeck) != 5:
+            raise ValueError(f"不正なカード数: {len(cardDeck)}")
+        pay = tuple(float(v) for v in (cls.PAYOFF_DEFAULT if payoff is None else payoff))
+        if len(pay) != 19:
+            raise ValueError("payoffは役ごと(19個)の配当です")
+
+        cls.warmup()
+        begin = time.perf_counter()
+        deadline = begin + budget_ms / 1000
+        hand = list(cardDeck.codes)
+        stub = cls._stubCodes(trump, hand, dead)
+        helds = [[hand[i] for i in range(5) if hold >> i & 1] for hold in range(32)]
+
+        count = [0] * 32
+        total = [0.0] * 32
+        totalSq = [0.0] * 32
+
+        if np is not None:
+            payArr = np.asarray(pay, dtype=np.float64)
+            stubArr = np.array(stub, dtype=np.int64)
+            rng = np.random.default_rng()
+            batch = 256
+        else:
+            batch = 16
+
+        while True:
+            for hold in range(32):
+                held = helds[hold]
+                k = 5 - len(held)
+                if np is not None:
+                    codes = np.empty((batch, 5), dtype=np.int64)
+                    codes[:, :len(held)] = held
+                    if k:
+                        idx = rng.random((batch, len(stub))).argpartition(k, axis=1)[:, :k]
+                        codes[:, len(held):] = stubArr[idx]
+                    cat, _ = cls.judgementBatch(codes)
+                    v = payArr[cat]
+                    total[hold] += float(v.sum())
+                    totalSq[hold] += float((v * v).sum())
+                else:
+                    for _ in range(batch):
+                        j, _ = cls.judgement(CardDeck.fromCodes(trump, held + random.sample(stub, k)))
+                        total[hold] += pay[j]
+                        totalSq[hold] += pay[j] * pay[j]
+                count[hold] += batch
+            now = time.perf_counter()
+            if progress is not None:
+                progress(min(1.0, (now - begin) / (deadline - begin)) if deadline > begin else 1.0)
+            if now >= deadline:
+                break
+
+        results = []
+        for hold in range(32):
+            n = count[hold]
+            ev = total[hold] / n
+            var = max(0.0, (totalSq[hold] - n * ev * ev) / (n - 1))
+            half = 1.96 * math.sqrt(var / n)
+            results.append(DiscardEstimate(
+                hold,
+                [i for i in range(5) if not hold >> i & 1],
+                ev,
+                (ev - half, ev + half),
+                n
+            ))
+        return results
+
+    @classmethod
+    def bestHandEstimate(cls, trump: Trump, cardDeck: CardDeck, budget_ms: float, dead: Optional[Iterable[Card]] = None, payoff: Optional[Sequence[float]] = None, *, progress: Optional[Callable[[float], None]] = None) -> DiscardEstimate:
+        """
+        制限時間内のモンテカルロ法の推定で期待値が最大の残し方
+        (信頼区間付き、期待値が同じ場合は残す枚数が多い方)
+        """
+        return max(
+            cls.monteCarloDiscard(trump, cardDeck, budget_ms, dead, payoff, progress=progress),
+            key=lambda r: (r.ev, bin(r.hold).count("1"))
+        )
+
+    @staticmethod
+    def _stubCodes(trump: Trump, hand: Iterable[int], dead: Optional[Iterable[Card]] = None) -> List[int]:
+        """
+        引く可能性のあるカード番号
+        (trumpの全カードから手札とdeadを除いたもの)
+        """
+        out = set(hand)
+        if dead is not None:
+            out.update(c.code for c in dead)
+        return sorted(c.code for c in trump.cardList if c.code not in out)
+
+    @classmethod
+    def _combinationIndex(cls, n: int, k: int) -> Any:
+        """
+        n個からk個選ぶ全ての組み合わせのインデックス((nCk, k)配列)
+        """
+        key = (n, k)
+        idx = cls._combinationCache.get(key)
+        if idx is None:
+            count = math.comb(n, k)
+            if k == 0:
+                idx = np.zeros((count, 0), dtype=np.uint8)
+            else:
+                idx = np.fromiter(
+                    chain.from_iterable(combinations(range(n), k)),
+                    dtype=np.uint8, count=count * k
+                ).reshape(count, k)
+            if len(cls._combinationCache) >= 16:
+                cls._combinationCache.clear()
+            cls._combinationCache[key] = idx
+        return idx
+
+    @classmethod
+    def buildDiscardTable(cls, path: str, useJokerCou: Literal[0, 1, 2] = 1, payoff: Optional[Sequence[float]] = None, workers: Optional[int] = None, limit: Optional[int] = None) -> int:
+        """
+        全ての手札の最適なカード交換をファイルに書き出す
+        (スートの入れ替えで同じになる手札は1つだけ計算)
+
+        並列で計算し、計算済みの手札は飛ばす(中断しても続きから再開できる)
+        limitで今回計算する手札の数を制限
+        未計算の手札の数を返す
+        """
+        if np is None:
+            raise ImportError("buildDiscardTableにはnumpyが必要です")
+        pay = tuple(float(v) for v in (cls.PAYOFF_DEFAULT if payoff is None else payoff))
+        if len(pay) != 19:
+            raise ValueError("payoffは役ごと(19個)の配当です")
+        header = cls._DISCARD_HEADER.pack(cls._DISCARD_MAGIC, cls._DISCARD_VERSION, useJokerCou, *pay)
+
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                if f.read(len(header)) != header:
+                    raise ValueError(f"設定の違う最適交換テーブル: {path}")
+        else:
+            with open(path, "wb") as f:
+                f.write(header)
+                f.write(b"\xff" * cls._DISCARD_SIZE)
+
+        hands = cls._canonicalHands(useJokerCou)
+        base = len(header)
+        with open(path, "r+b") as f, mmap.mmap(f.fileno(), 0) as mm:
+            todo = [
+                h for h in hands
+                if mm[base + cls._discardIndex(h)[0]] == 0xFF
+            ]
+            if limit is not None:
+                todo = todo[:limit]
+
+            chunk = 64
+            with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                future_list = [
+                    executor.submit(cls._discardTableChunk, useJokerCou, pay, todo[i:i+chunk])
+                    for i in range(0, len(todo), chunk)
+                ]
+                for future in futures.as_completed(future_list):
+                    for h, hold in future.result():
+                        mm[base + cls._discardIndex(h)[0]] = hold
+                    mm.flush()
+
+            return sum(
+                1 for h in hands
+                if mm[base + cls._discardIndex(h)[0]] == 0xFF
+            )
+
+    @classmethod
+    def _discardTableChunk(cls, useJokerCou: Literal[0, 1, 2], payoff: Tuple[float, ...], hands: List[Tuple[int, ...]]) -> List[Tuple[Tuple[int, ...], int]]:
+        """
+        最適交換テーブルの並列計算用
+        """
+        trump = Trump(useJokerCou)
+        return [
+            (h, cls.optimalDiscard(trump, CardDeck.fromCodes(trump, h), payoff=payoff).hold)
+            for h in hands
+        ]
+
+    @staticmethod
+    def _canonicalHands(useJokerCou: int) -> List[Tuple[int, ...]]:
+        """
+        スートの入れ替えで同じになるものを除いた全ての5枚の手札
+        (スートごとのランクのビットマスクが降順のもの)
+        """
+        masks: List[List[int]] = [[] for _ in range(6)]
+        for m in range(1 << 13):
+            n = bin(m).count("1")
+            if n <= 5:
+                masks[n].append(m)
+
+        hands: List[Tuple[int, ...]] = []
+
+        def rec(suit: int, rest: int, upper: int, codes: Tuple[int, ...], jokers: Tuple[int, ...]) -> None:
+            if suit == 3:
+                counts = [rest]
+            else:
+                counts = list(range(rest + 1))
+            for n in counts:
+                for m in masks[n]:
+                    if m > upper:
+                        continue
+                    add = tuple(suit * 13 + r for r in range(13) if m >> r & 1)
+                    if suit == 3 or n == rest:
+                        hands.append(codes + add + jokers)
+                    else:
+                        rec(suit + 1, rest - n, m, codes + add, jokers)
+
+        for j in range(min(useJokerCou, 5) + 1):
+            jokers = tuple(range(Card.CODE_JOKER, Card.CODE_JOKER + j))
+            if j == 5:
+                hands.append(jokers)
+            else:
+                rec(0, 5 - j, (1 << 13) - 1, (), jokers)
+        return hands
+
+    @staticmethod
+    def _discardIndex(codes: Iterable[int]) -> Tuple[int, Tuple[int, ...]]:
+        """
+        最適交換テーブルのインデックスと、並び順そのままのスートを振り直したカード番号
+        (ジョーカーは出てきた順に振り直す、インデックスは昇順のカード番号の組み合わせの番号)
+        """
+        codes = tuple(codes)
+        _, _, perm = Poker.canonicalCodes(codes)
+        joker = Card.CODE_JOKER
+        conv = []
+        for c in codes:
+            if c >= Card.CODE_JOKER:
+                conv.append(joker)
+                joker += 1
+            else:
+                conv.append(perm[c // 13] * 13 + c % 13)
+        index = sum(math.comb(c, i + 1) for i, c in enumerate(sorted(conv)))
+        return index, tuple(conv)
+
+    @classmethod
+    def loadDiscardTable(cls, path: str) -> None:
+        """
+        最適交換テーブルの読み込み(mmap)
+
+        読み込むとbestHandはテーブルを引くだけになる
+        (計算済みでない手札の場合は今まで通り計算)
+        """
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, useJokerCou, *pay = cls._DISCARD_HEADER.unpack_from(mm)
+        if magic != cls._DISCARD_MAGIC or version != cls._DISCARD_VERSION or len(mm) != cls._DISCARD_HEADER.size + cls._DISCARD_SIZE:
+            mm.close()
+            raise ValueError(f"不正な最適交換テーブル: {path}")
+        if cls._discardTable is not None:
+            cls._discardTable[0].close()
+        cls._discardTable = (mm, useJokerCou, tuple(pay))
+
+    @classmethod
+    def lookupDiscard(cls, trump: Trump, cardDeck: CardDeck) -> Optional[int]:
+        """
+        最適交換テーブルから残すカードのビットマスク(bit i: cardDeck.get(i))を引く
+        (テーブルが無い、デッキ構成が違う、未計算の場合はNone)
+        """
+        table = cls._discardTable
+        if table is None or len(cardDeck) != 5:
+            return None
+        mm, useJokerCou, _ = table
+        jokers = sum(1 for c in trump.cardList if c.code >= Card.CODE_JOKER)
+        if jokers != useJokerCou or len(trump.cardList) != Card.CODE_JOKER + jokers:
+            return None
+
+        index, conv = cls._discardIndex(cardDeck.codes)
+        hold = mm[cls._DISCARD_HEADER.size + index]
+        if hold == 0xFF:
+            return None
+        order = sorted(conv)
+        ret = 0
+        for i, c in enumerate(conv):
+            if hold >> order.index(c) & 1:
+                ret |= 1 << i
+        return ret
+
+    @classmethod
+    def executor(cls) -> WorkerPool:
+        """
+        常駐プロセスプール
+
+        初回呼び出し時に起動し、判定テーブルを共有メモリに置いて各プロセスから参照させる
+        (shutdownまで使い回す、呼ばれなくても終了時にshutdownする)
+        プールと共有メモリは組で返すので、1回の計算の間は同じものを使う
+        """
+        with cls._poolLock:
+            if cls._pool is None:
+                if not cls._atexitRegistered:
+                    atexit.register(cls.shutdown)
+                    cls._atexitRegistered = True
+                workers = os.cpu_count()
+                if workers is None:
+                    workers = 1
+                elif workers > 1:
+                    workers -= 1
+                shm, slots = cls._createShared()
+                try:
+                    executor = futures.ProcessPoolExecutor(
+                        max_workers=workers,
+                        initializer=cls._initWorker,
+                        initargs=(shm.name,)
+                    )
+                except BaseException:
+                    shm.close()
+                    shm.unlink()
+                    raise
+                cls._pool = WorkerPool(executor, shm, slots, workers)
+            return cls._pool
+
+    @classmethod
+    def shutdown(cls, wait: bool = True) -> None:
+        """
+        常駐プロセスプールの終了
+        (計算中のasyncBestHandはcancelする、次に使うときはまた起動する)
+        """
+        for task in list(cls._tasks):
+            task.cancel()
+        with cls._poolLock:
+            threadExecutor = cls._threadExecutor
+            cls._threadExecutor = None
+        if threadExecutor is not None:
+            threadExecutor.shutdown(wait=wait, cancel_futures=True)
+
+        with cls._poolLock:
+            pool = cls._pool
+            cls._pool = None
+        if pool is not None:
+            pool.executor.shutdown(wait=wait, cancel_futures=True)
+            pool.shared.close()
+            pool.shared.unlink()
+
+    @classmethod
+    def _createShared(cls) -> Tuple[shared_memory.SharedMemory, "queue.Queue[int]"]:
+        """
+        共有メモリの作成(executorから呼ぶ)
+
+        件数の後に判定テーブル(キーはint64、値はint32)、
+        その後に探索ごとの枠(手札5枚, 候補の枚数, 候補のカード番号)を並べる
+        (共有メモリと空いている枠の位置を返す)
         """
-        asyncio.new_event_loop().run_in_executor(
-            None,
-            lambda: callback(cls.bestHand(trump, cardDeck))
+        (keys, values), (flushKeys, flushValues) = cls._histogramTables()
+        header = cls._SHARED_HEADER.pack(len(keys), len(flushKeys))
+        data = header + keys.tobytes() + flushKeys.tobytes() + values.tobytes() + flushValues.tobytes()
+
+        shm = shared_memory.SharedMemory(
+            create=True,
+            size=len(data) + cls._SHARED_SLOT_SIZE * cls._SHARED_SLOT_COUNT
         )
+        shm.buf[:len(data)] = data
+        slots: "queue.Queue[int]" = queue.Queue()
+        for n in range(cls._SHARED_SLOT_COUNT):
+            slots.put(len(data) + n * cls._SHARED_SLOT_SIZE)
+        return shm, slots
+
+    @staticmethod
+    def _initWorker(sharedName: str) -> None:
+        """
+        常駐プロセスの初期化
+        (共有メモリの判定テーブルを参照する)
+        """
+        # fork時に親のプールの参照を引き継がないようにする
+        Poker._pool = None
+
+        shm = shared_memory.SharedMemory(name=sharedName)
+        n, m = Poker._SHARED_HEADER.unpack_from(shm.buf)
+        buf = shm.buf[Poker._SHARED_HEADER.size:]
+        keys = buf[:n * 8].cast("q")
+        buf = buf[n * 8:]
+        flushKeys = buf[:m * 8].cast("q")
+        buf = buf[m * 8:]
+        values = buf[:n * 4].cast("i")
+        buf = buf[n * 4:]
+        flushValues = buf[:m * 4].cast("i")
+        Poker._sharedWorker = shm
+        Poker._sharedView = (keys, values, flushKeys, flushValues, shm.buf)
 
     @classmethod
-    def bestHand(cls, trump: Trump, cardDeck: CardDeck) -> List[Literal[0, 1, 2, 3, 4]]:
+    def asyncBestHand(cls, trump: Trump, cardDeck: CardDeck, callback: Optional[Callable[[List[Literal[0, 1, 2, 3, 4]]], None]] = None, budget_ms: Optional[float] = None, dead: Optional[Iterable[Card]] = None) -> BestHandFuture:
         """
         現在の手からの最善手の計算
+
+        非同期バージョン
+        (計算に非常に時間がかかるため)
+        結果はBestHandFutureで受け取る(callbackは正常に終わった時のみ呼ばれる)
+        (deadは呼び出した時点のものを使う)
+        """
+        if dead is not None:
+            dead = list(dead)
+        task = BestHandFuture()
+        if callback is not None:
+            def done(f: futures.Future) -> None:
+                if not f.cancelled() and f.exception() is None:
+                    callback(f.result())
+            task.add_done_callback(done)
+        cls._tasks.add(task)
+        task.add_done_callback(cls._tasks.discard)
+
+        with cls._poolLock:
+            if cls._threadExecutor is None:
+                cls._threadExecutor = futures.ThreadPoolExecutor(
+                    max_workers=2, thread_name_prefix="bestHand"
+                )
+            threadExecutor = cls._threadExecutor
+        threadExecutor.submit(cls._runBestHand, task, trump, cardDeck, budget_ms, dead)
+        return task
+
+    @classmethod
+    def _runBestHand(cls, task: BestHandFuture, trump: Trump, cardDeck: CardDeck, budget_ms: Optional[float], dead: Optional[List[Card]]) -> None:
+        """
+        asyncBestHandの計算(スレッドで実行)
+        """
+        if task.cancelled():
+            return
+        task._started = True
+        try:
+            result = cls.bestHand(trump, cardDeck, budget_ms, dead, progress=task._setProgress)
+        except futures.CancelledError:
+            task.cancel()
+            return
+        except BaseException as e:
+            if task.set_running_or_notify_cancel():
+                task.set_exception(e)
+            return
+        if task.set_running_or_notify_cancel():
+            task.set_result(result)
+
+    @classmethod
+    def bestHand(cls, trump: Trump, cardDeck: CardDeck, budget_ms: Optional[float] = None, dead: Optional[Iterable[Card]] = None, *, progress: Optional[Callable[[float], None]] = None) -> List[Literal[0, 1, 2, 3, 4]]:
         """
-        bestMax = 0
-        bHand: Optional[CardDeck] = None
+        現在の手からの最善手の計算
 
-        cardList: List[str] = []
-        for c in trump.cardList:
-            cardList.append(c.judgeStr)
+        (最適交換テーブルを読み込んでいる場合はテーブルを引く)
+        budget_msを指定すると、その時間内のモンテカルロ法の推定で期待値が最大の残し方
+        deadには引けないことが分かっているカード(相手の捨て札など)を渡す
+        progressには計算の区切りごとに進捗(0～1)を渡す
+        """
+        hand = set(cardDeck.codes)
+        deadCodes = set() if dead is None else {c.code for c in dead} - hand
+        if not deadCodes:
+            # テーブルは死に札無しで計算している
+            hold = cls.lookupDiscard(trump, cardDeck)
+            if hold is not None:
+                return [i for i in range(5) if not hold >> i & 1]
+        if budget_ms is not None:
+            best = cls.bestHandEstimate(
+                trump, cardDeck, budget_ms,
+                [Card.fromCode(c) for c in deadCodes], progress=progress
+            )
+            return cast(List[Literal[0, 1, 2, 3, 4]], best.discard)
 
         cl = cardDeck.cardList
 
         start_time = time.perf_counter_ns()
 
-        tcv = cl[4].judgeStr
-        if tcv in cardList:
-            cardList.remove(tcv)
-        if "Joker" in cardList:
-            cardList.remove("Joker")
-
-        os_cpuCou = os.cpu_count()
-        if os_cpuCou is None:
-            os_cpuCou = 1
-        elif os_cpuCou > 1:
-            os_cpuCou -= 1
-
-        _iters = list(combinations(cardList, 4))
-        itLen = len(_iters)
-        iters = []
-        for v in range(0, itLen, itLen//os_cpuCou):
-            iters.append(_iters[v:v+itLen//os_cpuCou])
-
-        future_list = []
-        with futures.ProcessPoolExecutor(max_workers=os_cpuCou) as executor:
-            for iter_ in iters:
+        # 候補のカード(死に札、5枚目とジョーカー1枚を除く)
+        tcv = cl[4].code
+        pool = [c.code for c in trump.cardList if c.code not in deadCodes]
+        if tcv in pool:
+            pool.remove(tcv)
+        for c in pool:
+            if c >= Card.CODE_JOKER:
+                pool.remove(c)
+                break
+
+        executor, shm, slots, os_cpuCou = cls.executor()
+
+        # 手札と候補は共有メモリの枠に書き、各プロセスには枠の位置と組み合わせの番号の範囲だけを渡す
+        slot = slots.get()
+        try:
+            shm.buf[slot:slot+5] = bytes(cardDeck.codes)
+            shm.buf[slot+5] = len(pool)
+            shm.buf[slot+6:slot+6+len(pool)] = bytes(pool)
+
+            # 打ち切れるようにプロセス数より細かく分ける
+            itLen = math.comb(len(pool), 4)
+            step = -(-itLen // (os_cpuCou * 8))
+            future_list = []
+            for v in range(0, itLen, step):
                 future = executor.submit(
-                    fn=cls._iterBestHand, trump=trump, cl=cl, co=iter_, tcv=tcv
+                    cls._iterBestHand, slot, v, min(v + step, itLen)
                 )
                 future_list.append(future)
-        fl = futures.as_completed(fs=future_list)
-        for f in fl:
-            r, cd = f.result()
-            if r >= bestMax:
-                bestMax = r
-                bHand = cd
-
-        if bHand is None:
+            best = -1
+            try:
+                for n, f in enumerate(futures.as_completed(fs=future_list), 1):
+                    best = max(best, f.result())
+                    if progress is not None:
+                        progress(n / len(future_list))
+            except BaseException:
+                # 残りは取り消し、計算中のものが枠を読み終わるまで待つ
+                for f in future_list:
+                    f.cancel()
+                futures.wait(future_list)
+                raise
+        finally:
+            slots.put(slot)
+
+        if best < 0:
             return []
 
-        bHand.sort()
-
-        # print(cardDeck, bHand)
         print(f"{(time.perf_counter_ns() - start_time)//1e6} ms")
 
-        ret = []
-        for i in range(5):
-            f = True
-            for n in bHand.cardList:
-                if cl[i].judgeStr == n.judgeStr:
-                    f = False
+        # ジョーカーは区別しない
+        mask = best & ((1 << Card.CODE_MAX) - 1)
+        kept = {min(c, Card.CODE_JOKER) for c in range(Card.CODE_MAX) if mask >> c & 1}
+        return [i for i in range(5) if min(cl[i].code, Card.CODE_JOKER) not in kept]
+
+    @staticmethod
+    def _combinationRange(n: int, k: int, start: int, stop: int) -> Iterator[Tuple[int, ...]]:
+        """
+        n個からk個選ぶ組み合わせ(辞書順)のstart～stop-1番目
+        (combinations(range(n), k)と同じ順番)
+        """
+        if start >= stop:
+            return
+        # start番目の組み合わせを求める
+        idx = []
+        r = start
+        x = 0
+        for i in range(k):
+            while True:
+                c = math.comb(n - x - 1, k - i - 1)
+                if r < c:
                     break
-            if f:
-                ret.append(i)
-        return ret
+                r -= c
+                x += 1
+            idx.append(x)
+            x += 1
+
+        for _ in range(stop - start):
+            yield tuple(idx)
+            # 次の組み合わせ
+            i = k - 1
+            while i >= 0 and idx[i] == n - k + i:
+                i -= 1
+            if i < 0:
+                return
+            idx[i] += 1
+            for m in range(i + 1, k):
+                idx[m] = idx[m - 1] + 1
 
     @classmethod
-    def _iterBestHand(cls, trump: Trump, cl: List[Card], co, tcv: str) -> Tuple[int, Optional[CardDeck]]:
-        """
-        最善手の計算の並列計算用
+    def _iterBestHand(cls, slot: int, start: int, stop: int) -> int:
         """
-        bestMax = 0
-        bHand: Optional[CardDeck] = None
+        最善手の計算の並列計算用(常駐プロセスで実行)
 
-        for v in co:
-            s = set(v+(tcv, ))
-            if len(s) != 5:
-                continue
-            cd = CardDeck(trump, [Card.convert(i) for i in s])
-            j, h = cls.judgement(cd)
+        共有メモリの枠の候補から4枚選ぶ組み合わせのstart～stop-1番目に
+        手札の5枚目を加えたものを調べる
+        評価値 << 54 | 選んだ5枚のビットマスク(候補が無い場合は-1)を返す
+        """
+        keys, values, flushKeys, flushValues, buf = cast(
+            Tuple[memoryview, memoryview, memoryview, memoryview, memoryview],
+            cls._sharedView
+        )
+        hand = bytes(buf[slot:slot+5])
+        pool = bytes(buf[slot+6:slot+6+buf[slot+5]])
+        tcv = hand[4]
+        # ジョーカーは区別しない
+        handMask = 0
+        for c in hand:
+            handMask |= 1 << min(c, Card.CODE_JOKER)
+
+        # カード番号ごとのランク分布のキーとスート(ジョーカーは4)
+        rankKey = [5 ** (13 if c >= Card.CODE_JOKER else c % 13) for c in range(Card.CODE_MAX)]
+        suitOf = [min(c // 13, 4) for c in range(Card.CODE_MAX)]
+        n = len(keys)
+        m = len(flushKeys)
+
+        best = -1
+        for v in cls._combinationRange(len(pool), 4, start, stop):
+            codes = [pool[i] for i in v]
+            codes.append(tcv)
+            key = 0
+            suits = set()
+            mask = 0
+            same = 0
+            for c in codes:
+                key += rankKey[c]
+                suits.add(suitOf[c])
+                mask |= 1 << c
+                same |= 1 << min(c, Card.CODE_JOKER)
+            suits.discard(4)
+
+            h = -1
+            if len(suits) <= 1:
+                i = bisect_left(flushKeys, key)
+                if i < m and flushKeys[i] == key:
+                    h = flushValues[i]
+            if h < 0:
+                i = bisect_left(keys, key)
+                if i >= n or keys[i] != key:
+                    continue
+                h = values[i]
+
+            j = h >> 24
             if j <= 2:
                 continue
-            r = 5 - cls._checkHand(cl, cd.cardList)
+            r = 5 - bin(handMask & same).count("1")
 
             r = 100 - r * 20 + j
             if j <= 5:
                 # ツーペア
                 # スリーカード
-                hr = h[2].rank
-                if hr == 1 or hr == "Joker":
-                    hr = 14
+                hr = min(14, h >> 12 & 0xF)
                 r -= 14 - hr
             elif j == 12 or j == 13:
                 # フォーカード
-                hr = h[1].rank
-                if hr == 1 or hr == "Joker":
-                    hr = 14
+                hr = min(14, h >> 16 & 0xF)
                 r -= 14 - hr
 
-            if r >= bestMax:
-                bestMax = r
-                bHand = cd
-
-        return bestMax, bHand
+            if r >= 0:
+                best = max(best, r << Card.CODE_MAX | mask)
 
-    @staticmethod
-    def _checkHand(oHand: List[Card], nHand: List[Card]) -> int:
-        """
-        どれくらい現在の手に一致しているか
-        """
-        cou = 0
-        for o in oHand:
-            for n in nHand:
-                if o.judgeStr == n.judgeStr:
-                    cou += 1
-                    break
-        return cou
+        return best
@@ -5,15 +5,21 @@ import os
 import random as rnd
 
 from tkinterControl import Tkc
-from lib.trump import Trump, Poker
+from lib.trump import Trump, Poker, Card
 from lib.calc2d import Vector2
 
 IMG_PATH = "img/"
+DISCARD_TABLE_PATH = "discard_table.bin"  # Poker.buildDiscardTableで作成
+CPU_BUDGET_MS = 2000  # cpuの思考時間
 
 
 def main() -> None:
 
     trump = Trump(1)
+    if os.path.exists(DISCARD_TABLE_PATH):
+        Poker.loadDiscardTable(DISCARD_TABLE_PATH)
+    # cpuの初回の思考時間に判定テーブルの作成時間が入らないようにする
+    Poker.warmup()
 
     # 本体
     tkc = Tkc(
@@ -81,6 +87,8 @@ def main() -> None:
         cpuData = []
         animRateProgression = 0
         cpCalcWait = False
+        cpuTask = None
+        deadCards: List[Card] = []  # cpuから見えている捨て札
 
         vd: tuple = (0,)*3
 
@@ -91,8 +99,8 @@ def main() -> None:
         for d in trump.deckList:
             d.sort()
 
-        g.cpCalcWait = True
-        Poker.asyncBestHand(trump, trump.deckList[1], abh)
+        g.deadCards = []
+        cpuStart()
 
         initDraw()
         g.isNotClick = False
@@ -185,6 +193,7 @@ def main() -> None:
                 if l[1].getPos().y != playBasePos.y:
                     c = trump.throwDeck.pop(0)
                     trump.deckList[0].remove(l[1].name)
+                    g.deadCards.append(Card.convert(l[1].name))
                     trump.deckList[0].add(c)
                     l[1] = canvas.drawImage(
                         c.judgeStr,
@@ -216,8 +225,7 @@ def main() -> None:
             g.loopCou += 1
             if g.loopCou < g.loopMax:
                 g.animTurn = False
-                g.cpCalcWait = True
-                Poker.asyncBestHand(trump, trump.deckList[1], abh)
+                cpuStart()
                 return
             g.loopCou = 0
             g.animRateProgression = 10
@@ -381,6 +389,7 @@ def main() -> None:
                 if l[1].getPos().y != cpBasePos.y:
                     c = trump.throwDeck.pop(0)
                     trump.deckList[1].remove(l[1].name)
+                    g.deadCards.append(Card.convert(l[1].name))
                     trump.deckList[1].add(c)
                     l[1] = canvas.drawImage(
                         "back",
@@ -404,6 +413,15 @@ def main() -> None:
                 c.destroy()
             g.animRateProgression = 11
 
+    def cpuStart() -> None:
+        # 前の手の計算が残っていれば打ち切る
+        if g.cpuTask is not None:
+            g.cpuTask.cancel()
+        g.cpCalcWait = True
+        g.cpuTask = Poker.asyncBestHand(
+            trump, trump.deckList[1], abh, CPU_BUDGET_MS, g.deadCards
+        )
+
     def abh(t) -> None:
         for v in t:
             g.cpuData.append([v])
@@ -481,6 +499,10 @@ def main() -> None:
     init()
     tkc.drawStart()
 
+    if g.cpuTask is not None:
+        g.cpuTask.cancel()
+    Poker.shutdown(wait=False)
+
 
 if __name__ == "__main__":
     # カレントディレクトリ修正